@@ -0,0 +1,152 @@
+"""
+Persistent caches that let repeat runs skip expensive work.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Optional, Dict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "smart-file-organizer"
+
+# Files are hashed in chunks of this many bytes
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class ClassificationCache:
+    """
+    Caches classifications by a hash of the document text and the model that
+    produced them. Only exact text matches are reused: a classification
+    includes a filename built from the document's own dates and amounts, so
+    even a near-identical document (same vendor template, different date)
+    needs its own.
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR):
+        cache_dir = Path(cache_dir).expanduser()
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(cache_dir / "classifications.sqlite"), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS text_classifications ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, category TEXT NOT NULL, "
+                "new_filename TEXT NOT NULL)"
+            )
+
+    def get(self, text: str, model: str) -> Optional[Dict[str, str]]:
+        """Return a cached classification of this text by model, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT category, new_filename FROM text_classifications WHERE key = ?",
+                (self._hash(text, model),)
+            ).fetchone()
+        return {'category': row[0], 'new_filename': row[1]} if row else None
+
+    def put(self, text: str, model: str, result: Dict[str, str]):
+        """Store a classification of this text by model."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO text_classifications (key, model, category, new_filename) "
+                "VALUES (?, ?, ?, ?)",
+                (self._hash(text, model), model, result['category'], result['new_filename'])
+            )
+
+    @staticmethod
+    def _hash(text: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\n{text}".encode('utf-8')).hexdigest()
+
+
+class FileCache:
+    """
+    Caches extracted text and the final classification per input file, so
+    unchanged files skip the whole pipeline on later runs. Text is keyed by
+    the file's real path, mtime and size, which needs only a stat to look up;
+    classifications are keyed by size, mtime and SHA-256 of the contents.
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR):
+        cache_dir = Path(cache_dir).expanduser()
+        cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._keys: Dict[Path, str] = {}
+        self._conn = sqlite3.connect(str(cache_dir / "files.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "key TEXT PRIMARY KEY, category TEXT, new_filename TEXT, model TEXT)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extracted_texts ("
+                "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, "
+                "text BLOB NOT NULL, created REAL NOT NULL)"
+            )
+
+    def get_text(self, file_path: Path) -> Optional[str]:
+        """Return the cached extracted text for a file, or None on a miss."""
+        path = os.path.realpath(file_path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM extracted_texts WHERE path = ? AND mtime_ns = ? AND size = ?",
+                (path, stat.st_mtime_ns, stat.st_size)
+            ).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def put_text(self, file_path: Path, text: str):
+        """Store the extracted text for a file, replacing any from an older version of it."""
+        path = os.path.realpath(file_path)
+        stat = os.stat(path)
+        self._execute(
+            "INSERT OR REPLACE INTO extracted_texts VALUES (?, ?, ?, ?, ?)",
+            (path, stat.st_mtime_ns, stat.st_size, zlib.compress(text.encode('utf-8')), time.time())
+        )
+
+    def get_classification(self, file_path: Path, model: str) -> Optional[Dict[str, str]]:
+        """Return the classification of a file made by model, or None on a miss."""
+        row = self._get(file_path, "category, new_filename, model")
+        if not row or row[0] is None or row[2] != model:
+            return None
+        return {'category': row[0], 'new_filename': row[1]}
+
+    def put_classification(self, file_path: Path, model: str, result: Dict[str, str]):
+        """Store the classification of a file made by model."""
+        self._execute(
+            "INSERT INTO files (key, category, new_filename, model) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET category = excluded.category, "
+            "new_filename = excluded.new_filename, model = excluded.model",
+            (self._key(file_path), result['category'], result['new_filename'], model)
+        )
+
+    def _get(self, file_path: Path, columns: str):
+        key = self._key(file_path)
+        with self._lock:
+            return self._conn.execute(f"SELECT {columns} FROM files WHERE key = ?", (key,)).fetchone()
+
+    def _execute(self, sql: str, params: tuple):
+        with self._lock, self._conn:
+            self._conn.execute(sql, params)
+
+    def _key(self, file_path: Path) -> str:
+        """Compute (once per run) the cache key of a file from its size, mtime and contents."""
+        key = self._keys.get(file_path)
+        if key is None:
+            stat = file_path.stat()
+            sha256 = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            digest = sha256.hexdigest()
+            key = f"{stat.st_size}:{int(stat.st_mtime)}:{digest}"
+            self._keys[file_path] = key
+        return key
@@ -1,27 +1,115 @@
 """
 LLM prompt and JSON parsing for categorization and renaming.
 """
-import json
 import logging
-from typing import Optional, Dict, Any
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, TYPE_CHECKING
 from datetime import datetime
 
 try:
-    from anthropic import Anthropic
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+try:
+    import httpx
+    from anthropic import Anthropic, DefaultHttpxClient
 except ImportError:
     Anthropic = None
 
+try:
+    import h2  # noqa: F401 - enables HTTP/2 support in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+if TYPE_CHECKING:
+    from cache import ClassificationCache
+
 logger = logging.getLogger(__name__)
 
+# Upper bound on simultaneous API requests when the classifier is shared
+# between worker threads, to stay under the account's rate limit.
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+
+# One connection pool is shared by all worker threads. Keep-alive (and HTTP/2
+# multiplexing when the h2 package is installed) avoids a TCP/TLS handshake
+# per request. The pool holds one kept-alive connection per request slot, so
+# every concurrent request reuses a warm connection and none are churned.
+HTTP_TIMEOUT = 60
+
+DEFAULT_MODEL = "claude-3-haiku-20240307"
+
+# Replies are prefilled with the opening brace of the expected JSON object
+RESPONSE_PREFILL = "{"
+
+# Seconds between status checks while a Message Batches job is running.
+BATCH_POLL_INTERVAL = 30
+
+# Grouped prompts send several documents per request. Each document gets a
+# shorter excerpt than a single-file prompt, and groups are sized by a rough
+# 4-characters-per-token estimate so the whole prompt stays small.
+GROUP_DOCUMENT_TEXT_LENGTH = 1500
+MAX_GROUP_PROMPT_TOKENS = 6000
+MAX_GROUP_SIZE = 20
+
+# Character substitutions applied to LLM-suggested names
+_CATEGORY_TRANSLATION = str.maketrans({'/': '_', '\\': '_'})
+_FILENAME_TRANSLATION = str.maketrans({c: '_' for c in ' /\\:*?"<>|'})
+_UNDERSCORE_RUN_RE = re.compile(r'_+')
+
+# Files whose name already contains a date and one of these document types
+# (e.g. "uber_receipt_2024-03-12.pdf") are classified without an API call.
+# Categories follow the prompt's broad category list.
+LOCAL_PATTERNS = [
+    (re.compile(r'receipt', re.IGNORECASE), "Receipts"),
+    (re.compile(r'(bank|chase|wells|checking|savings).*statement', re.IGNORECASE), "Bank Statements"),
+    (re.compile(r'boarding.?pass|itinerary|e.?ticket', re.IGNORECASE), "Travel Documents"),
+    (re.compile(r'invoice', re.IGNORECASE), "Invoices"),
+    (re.compile(r'(?<![a-z])w-?2(?![a-z0-9])|1099|tax.?return', re.IGNORECASE), "Tax Documents"),
+    (re.compile(r'(electric|water|gas|utility|internet).*bill', re.IGNORECASE), "Utilities"),
+]
+_FILENAME_DATE_RE = re.compile(r'(19|20)\d{2}-\d{2}')
+
+RESPONSE_FIELDS = """1. "category": A broad, consistent category name from this list or similar: "Receipts", "Bank Statements", "Travel Documents", "Medical Records", "Insurance Documents", "Tax Documents", "Contracts", "Invoices", "Personal Finance", "Work Documents", "Legal Documents", "Utilities", "Education", "Real Estate"
+2. "new_filename": A descriptive filename including vendor/company, document type, and date if available (without file extension)"""
+
+RESPONSE_GUIDELINES = """Guidelines for categories:
+- Use BROAD categories to avoid fragmentation (e.g., "Receipts" not "Uber Receipts" or "Food Receipts")
+- Be consistent - similar documents should go in the same category
+- Prefer general terms over specific ones
+- If unsure, choose the closest broad category from the list above
+
+Guidelines for filenames:
+- Include dates in YYYY-MM-DD format when possible
+- Include vendor/company name when identifiable
+- Keep filenames under 80 characters
+- Use underscores instead of spaces in filenames"""
+
 
 class FileClassifier:
     """Handles file classification using LLM."""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+                 cache: Optional['ClassificationCache'] = None, model: str = DEFAULT_MODEL):
         if not Anthropic:
             raise ImportError("Anthropic package not available. Install with: pip install anthropic")
         
-        self.client = Anthropic(api_key=api_key)
+        max_concurrent_requests = max(1, max_concurrent_requests)
+        http_client = DefaultHttpxClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=max_concurrent_requests,
+                                max_keepalive_connections=max_concurrent_requests,
+                                keepalive_expiry=HTTP_TIMEOUT),
+        )
+        self.client = Anthropic(api_key=api_key, http_client=http_client)
+        self._request_slots = threading.Semaphore(max_concurrent_requests)
+        self.cache = cache
+        self.model = model
     
     def classify_file(self, filename: str, extracted_text: str) -> Optional[Dict[str, str]]:
         """
@@ -38,26 +126,219 @@ class FileClassifier:
             logger.warning(f"No text content to classify for {filename}")
             return None
         
+        local = self._classify_locally(filename)
+        if local:
+            logger.debug("Classified %s from its name", filename)
+            return local
+        
         prompt = self._build_prompt(filename, extracted_text)
         
+        if self.cache:
+            cached = self.cache.get(extracted_text, self.model)
+            if cached:
+                logger.debug("Using cached classification for %s", filename)
+                return cached
+        
         try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=200,
-                temperature=0.1,
-                system="You are a file organizer assistant. Analyze documents and provide structured categorization.",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            with self._request_slots:
+                response = self.client.messages.create(**self._request_params(prompt))
             
-            content = response.content[0].text
-            return self._parse_response(content)
+            content = self._response_text(response)
+            result = self._parse_response(content)
+            if result and self.cache:
+                self.cache.put(extracted_text, self.model, result)
+            return result
             
         except Exception as e:
             logger.error(f"Error calling Claude API: {e}")
             return None
     
+    def classify_files_batch(self, items: List[Tuple[str, str]]) -> List[Optional[Dict[str, str]]]:
+        """
+        Classify many files with a single Message Batches API job.
+        
+        Batched requests are billed at half the online price but are queued,
+        so this blocks until the whole job has finished.
+        
+        Args:
+            items: List of (filename, extracted_text) pairs
+            
+        Returns:
+            One classification (or None if it failed) per item, in input order
+        """
+        results: List[Optional[Dict[str, str]]] = [None] * len(items)
+        
+        requests = []
+        for index, (filename, extracted_text) in enumerate(items):
+            if not extracted_text or not extracted_text.strip():
+                logger.warning(f"No text content to classify for {filename}")
+                continue
+            results[index] = self._classify_locally(filename)
+            if results[index]:
+                continue
+            if self.cache:
+                results[index] = self.cache.get(extracted_text, self.model)
+                if results[index]:
+                    continue
+            requests.append({
+                "custom_id": f"file-{index}",
+                "params": self._request_params(self._build_prompt(filename, extracted_text)),
+            })
+        
+        if not requests:
+            return results
+        
+        try:
+            batch = self.client.messages.batches.create(requests=requests)
+            logger.info(f"Submitted message batch {batch.id} with {len(requests)} requests")
+            
+            while batch.processing_status != "ended":
+                time.sleep(BATCH_POLL_INTERVAL)
+                batch = self.client.messages.batches.retrieve(batch.id)
+        except Exception as e:
+            logger.error(f"Error calling Claude Message Batches API: {e}")
+            return results
+        
+        # One bad entry must not discard the results already parsed or
+        # still to come
+        try:
+            for entry in self.client.messages.batches.results(batch.id):
+                try:
+                    index = int(entry.custom_id.split('-', 1)[1])
+                    if entry.result.type != "succeeded":
+                        logger.error(f"Batch request for {items[index][0]} {entry.result.type}")
+                        continue
+                    results[index] = self._parse_response(self._response_text(entry.result.message))
+                    if results[index] and self.cache:
+                        self.cache.put(items[index][1], self.model, results[index])
+                except Exception as e:
+                    logger.error(f"Error processing batch result {entry.custom_id}: {e}")
+        except Exception as e:
+            logger.error(f"Error reading results of message batch {batch.id}: {e}")
+        
+        return results
+    
+    def plan_groups(self, items: List[Tuple[str, str]]) -> List[List[int]]:
+        """
+        Split items into groups for classify_batch, keeping each group's
+        estimated prompt size under MAX_GROUP_PROMPT_TOKENS.
+        
+        Returns:
+            Lists of indices into items
+        """
+        groups: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        
+        for index, (filename, text) in enumerate(items):
+            tokens = self._estimate_tokens(filename) + self._estimate_tokens(text[:GROUP_DOCUMENT_TEXT_LENGTH])
+            if current and (current_tokens + tokens > MAX_GROUP_PROMPT_TOKENS or len(current) >= MAX_GROUP_SIZE):
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        
+        if current:
+            groups.append(current)
+        return groups
+    
+    def classify_batch(self, items: List[Tuple[str, str]]) -> List[Optional[Dict[str, str]]]:
+        """
+        Classify several files with a single request, sharing the instructions
+        between them. Documents the grouped response doesn't classify properly
+        are retried one at a time with classify_file.
+        
+        Args:
+            items: List of (filename, extracted_text) pairs, see plan_groups
+            
+        Returns:
+            One classification (or None if it failed) per item, in input order
+        """
+        results: List[Optional[Dict[str, str]]] = [None] * len(items)
+        
+        pending = []
+        for index, (filename, extracted_text) in enumerate(items):
+            if not extracted_text or not extracted_text.strip():
+                logger.warning(f"No text content to classify for {filename}")
+                continue
+            results[index] = self._classify_locally(filename)
+            if results[index]:
+                continue
+            if self.cache:
+                results[index] = self.cache.get(extracted_text, self.model)
+                if results[index]:
+                    continue
+            pending.append(index)
+        
+        if not pending:
+            return results
+        
+        prompt = self._build_group_prompt([items[index] for index in pending])
+        
+        try:
+            with self._request_slots:
+                response = self.client.messages.create(
+                    **self._request_params(prompt, max_tokens=100 * len(pending) + 100)
+                )
+            
+            content = self._response_text(response)
+            group_results = self._parse_group_response(content, len(pending))
+            
+        except Exception as e:
+            logger.error(f"Error calling Claude API: {e}")
+            return results
+        
+        for index, result in zip(pending, group_results):
+            if result is None:
+                # The grouped answer didn't match the schema for this
+                # document; ask about it on its own instead
+                results[index] = self.classify_file(*items[index])
+                continue
+            results[index] = result
+            if self.cache:
+                self.cache.put(items[index][1], self.model, result)
+        
+        return results
+    
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Rough token count, good enough for sizing prompt groups."""
+        return len(text) // 4 + 1
+    
+    def _classify_locally(self, filename: str) -> Optional[Dict[str, str]]:
+        """
+        Classify a file from its name alone when it is already descriptive,
+        i.e. it contains a date and names an obvious document type.
+        """
+        stem = Path(filename).stem
+        if not _FILENAME_DATE_RE.search(stem):
+            return None
+        
+        for pattern, category in LOCAL_PATTERNS:
+            if pattern.search(stem):
+                return {'category': category, 'new_filename': self._clean_filename(stem)}
+        return None
+    
+    def _request_params(self, prompt: str, max_tokens: int = 200) -> Dict[str, Any]:
+        """Build the Messages API arguments for a classification prompt."""
+        return {
+            "model": self.model,
+            "max_tokens": max_tokens,
+            "temperature": 0.1,
+            "system": "You are a file organizer assistant. Analyze documents and provide structured categorization.",
+            "messages": [
+                {"role": "user", "content": prompt},
+                # Prefilling the reply makes the model answer with the JSON
+                # object directly instead of wrapping it in prose
+                {"role": "assistant", "content": RESPONSE_PREFILL},
+            ],
+        }
+    
+    @staticmethod
+    def _response_text(message) -> str:
+        """Return the full reply text of a message, including the prefilled start."""
+        return RESPONSE_PREFILL + message.content[0].text
+    
     def _build_prompt(self, filename: str, text: str) -> str:
         """Build the classification prompt."""
         # Truncate text if too long
@@ -73,47 +354,81 @@ Document content:
 {text}
 
 Please respond with a JSON object containing:
-1. "category": A broad, consistent category name from this list or similar: "Receipts", "Bank Statements", "Travel Documents", "Medical Records", "Insurance Documents", "Tax Documents", "Contracts", "Invoices", "Personal Finance", "Work Documents", "Legal Documents", "Utilities", "Education", "Real Estate"
-2. "new_filename": A descriptive filename including vendor/company, document type, and date if available (without file extension)
-
-Guidelines for categories:
-- Use BROAD categories to avoid fragmentation (e.g., "Receipts" not "Uber Receipts" or "Food Receipts")
-- Be consistent - similar documents should go in the same category
-- Prefer general terms over specific ones
-- If unsure, choose the closest broad category from the list above
+{RESPONSE_FIELDS}
 
-Guidelines for filenames:
-- Include dates in YYYY-MM-DD format when possible
-- Include vendor/company name when identifiable
-- Keep filenames under 80 characters
-- Use underscores instead of spaces in filenames
+{RESPONSE_GUIDELINES}
 
 Example responses:
 {{"category": "Receipts", "new_filename": "uber_ride_receipt_2024-01-15_downtown"}}
 {{"category": "Bank Statements", "new_filename": "chase_checking_statement_2024-01"}}
 {{"category": "Travel Documents", "new_filename": "united_boarding_pass_2024-02-10_sfo_jfk"}}
 
+Response:"""
+    
+    def _build_group_prompt(self, items: List[Tuple[str, str]]) -> str:
+        """Build one prompt that classifies several documents at once."""
+        documents = []
+        for number, (filename, text) in enumerate(items, 1):
+            if len(text) > GROUP_DOCUMENT_TEXT_LENGTH:
+                text = text[:GROUP_DOCUMENT_TEXT_LENGTH] + "..."
+            documents.append(f"[{number}] Original filename: {filename}\nDocument content:\n{text}")
+        documents = "\n\n".join(documents)
+        
+        return f"""
+Analyze each of the following {len(items)} documents and provide categorization information.
+
+{documents}
+
+Please respond with a JSON object of the form {{"results": [...]}}, where "results" is an array of exactly {len(items)} objects in the same order as the documents above, each containing:
+{RESPONSE_FIELDS}
+
+{RESPONSE_GUIDELINES}
+
+Example response for 2 documents:
+{{"results": [{{"category": "Receipts", "new_filename": "uber_ride_receipt_2024-01-15_downtown"}}, {{"category": "Bank Statements", "new_filename": "chase_checking_statement_2024-01"}}]}}
+
 Response:"""
     
     def _parse_response(self, response_content: str) -> Optional[Dict[str, str]]:
         """Parse the LLM response and extract category and filename."""
+        result = self._extract_json(response_content)
+        return self._clean_result(result) if result is not None else None
+    
+    def _parse_group_response(self, response_content: str, expected: int) -> List[Optional[Dict[str, str]]]:
+        """Parse a grouped-prompt response into one classification per document."""
+        data = self._extract_json(response_content)
+        results = data.get('results') if isinstance(data, dict) else None
+        
+        if not isinstance(results, list) or len(results) != expected:
+            logger.error(f"Expected a 'results' array of {expected} items in grouped response")
+            return [None] * expected
+        
+        return [self._clean_result(item) for item in results]
+    
+    def _extract_json(self, response_content: str) -> Optional[Any]:
+        """Decode the JSON object in an LLM response."""
         try:
-            # Try to find JSON in the response
+            # The reply starts with the prefilled '{'; drop anything the model
+            # may have added after the closing brace
             response_content = response_content.strip()
-            
-            # Look for JSON block
-            start_idx = response_content.find('{')
             end_idx = response_content.rfind('}') + 1
             
-            if start_idx == -1 or end_idx == 0:
+            if not response_content.startswith('{') or end_idx == 0:
                 logger.error("No JSON found in response")
                 return None
             
-            json_str = response_content[start_idx:end_idx]
-            result = json.loads(json_str)
+            json_str = response_content[:end_idx]
+            return _json.loads(json_str)
             
+        except _json.JSONDecodeError as e:
+            logger.error(f"Failed to parse JSON response: {e}")
+            return None
+    
+    def _clean_result(self, result: Any) -> Optional[Dict[str, str]]:
+        """Validate and clean a single classification object."""
+        try:
             # Validate required fields
-            if 'category' not in result or 'new_filename' not in result:
+            if not isinstance(result, dict) or 'category' not in result or 'new_filename' not in result:
                 logger.error("Missing required fields in response")
                 return None
             
@@ -123,34 +438,20 @@ Response:"""
             
             return result
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON response: {e}")
-            return None
         except Exception as e:
             logger.error(f"Error parsing response: {e}")
             return None
     
     def _clean_category(self, category: str) -> str:
         """Clean and standardize category name."""
-        # Remove extra whitespace and limit length
-        category = category.strip()[:50]
-        # Replace problematic characters for folder names
-        category = category.replace('/', '_').replace('\\', '_')
-        return category
+        # Remove extra whitespace, limit length and replace problematic
+        # characters for folder names
+        return category.strip()[:50].translate(_CATEGORY_TRANSLATION)
     
     def _clean_filename(self, filename: str) -> str:
         """Clean and standardize filename."""
-        # Remove extra whitespace and limit length
-        filename = filename.strip()[:80]
-        # Replace spaces with underscores and remove problematic characters
-        filename = filename.replace(' ', '_')
-        # Remove or replace problematic characters
-        problematic_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
-        for char in problematic_chars:
-            filename = filename.replace(char, '_')
-        # Remove multiple consecutive underscores
-        while '__' in filename:
-            filename = filename.replace('__', '_')
-        # Remove leading/trailing underscores
-        filename = filename.strip('_')
-        return filename
\ No newline at end of file
+        # Remove extra whitespace and limit length, then replace spaces and
+        # problematic characters with underscores in a single pass
+        filename = filename.strip()[:80].translate(_FILENAME_TRANSLATION)
+        # Collapse runs of underscores and remove leading/trailing ones
+        return _UNDERSCORE_RUN_RE.sub('_', filename).strip('_')
@@ -2,16 +2,41 @@
 File type detection and text extraction logic.
 """
 import os
+import shutil
+import subprocess
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 import logging
+import threading
+
+try:
+    from PIL import Image, ImageFilter, ExifTags
+except ImportError:
+    Image = None
 
 try:
     import pytesseract
-    from PIL import Image
 except ImportError:
     pytesseract = None
-    Image = None
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+try:
+    import pymupdf as fitz
+except ImportError:
+    try:
+        # PyMuPDF before 1.24.3 only ships the fitz module name
+        import fitz
+    except ImportError:
+        fitz = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
 
 try:
     from pdfminer.high_level import extract_text as pdf_extract_text
@@ -25,6 +50,55 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Only the start of a document reaches the classifier prompt (2000 chars), so
+# extractors stop once they have gathered this much text, and long PDFs are
+# never read past MAX_PDF_PAGES.
+MAX_EXTRACT_CHARS = 4000
+MAX_PDF_PAGES = 50
+
+# pypdfium2 output shorter than this (e.g. from a scanned PDF) is retried
+# with pdfminer.
+MIN_PDF_TEXT_LENGTH = 20
+
+# Tesseract's runtime grows with pixel count and document-sized text stays
+# legible well below phone-camera resolutions, so images are converted to
+# grayscale and shrunk to fit this size before OCR.
+OCR_MAX_DIMENSION = 1600
+# Images smaller than this (icons, favicons) can't hold legible text
+MIN_OCR_PIXELS = 10_000
+# LSTM engine, single uniform block of text (receipts, letters, screenshots)
+OCR_CONFIG = '--oem 1 --psm 6'
+
+# Before OCR, a thumbnail of the image is checked for anything that could
+# be text: printed text has strong contrast and sharp edges, while blank
+# scans, skies and smooth or out-of-focus photos have neither. Images failing
+# the check are described by their EXIF metadata instead of OCR'd. The
+# thresholds err towards running OCR; a single line on an A4 scan passes.
+TEXT_PROBE_SIZE = 512
+MIN_TEXT_CONTRAST = 64          # darkest to lightest grayscale level
+TEXT_EDGE_THRESHOLD = 64        # FIND_EDGES response counted as a sharp edge
+MIN_TEXT_EDGE_DENSITY = 0.0002  # fraction of thumbnail pixels on sharp edges
+
+# PDF text backends, fastest first. "auto" uses the fastest one installed
+# and retries short output with pdfminer; any other choice uses only that
+# backend. pypdfium2 and PyMuPDF both run in-process and stop once
+# MAX_EXTRACT_CHARS are gathered (pypdfium2 measured slightly faster, about
+# 2 ms vs 3 ms on a 60-page PDF); pdftotext costs a process per PDF and
+# always reads MAX_PDF_PAGES, so it comes last.
+PDF_EXTRACTORS = ('auto', 'pdfium', 'fitz', 'pdftotext', 'pdfminer')
+PDFTOTEXT = shutil.which('pdftotext')
+PDFTOTEXT_TIMEOUT = 60
+_pdf_extractor = 'auto'
+
+# Neither PDFium nor MuPDF is thread-safe, so calls into each are serialized.
+# pdftotext runs in its own process and needs no lock.
+_pdfium_lock = threading.Lock()
+_fitz_lock = threading.Lock()
+
+# tesserocr APIs are not thread-safe either, so each worker thread keeps its
+# own, loading the Tesseract model once per thread rather than once per image.
+_ocr_state = threading.local()
+
 
 def detect_file_type(file_path: Path) -> str:
     """Detect file type based on extension."""
@@ -44,31 +118,202 @@ def detect_file_type(file_path: Path) -> str:
 
 def extract_text_from_image(file_path: Path) -> Optional[str]:
     """Extract text from image using OCR."""
-    if not pytesseract or not Image:
-        logger.warning("OCR dependencies not available. Install pytesseract and pillow.")
+    if not Image or not (tesserocr or pytesseract):
+        logger.warning("OCR dependencies not available. Install pillow and tesserocr or pytesseract.")
         return None
     
     try:
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image)
+        with Image.open(file_path) as image:
+            width, height = image.size
+            if width * height < MIN_OCR_PIXELS:
+                logger.debug("Skipping OCR for %s: %dx%d is too small to hold text", file_path, width, height)
+                return None
+            prepared = _prepare_image_for_ocr(image)
+            if not _likely_has_text(prepared):
+                logger.debug("Skipping OCR for %s: no text-like regions found", file_path)
+                return _describe_image(image, file_path, width, height)
+            text = _ocr_image(prepared)
         return text.strip() if text else None
     except Exception as e:
         logger.error(f"Error extracting text from image {file_path}: {e}")
         return None
 
 
+def _likely_has_text(image) -> bool:
+    """Cheaply check whether a grayscale image has the contrast and edges of printed text."""
+    probe = image.copy()
+    probe.thumbnail((TEXT_PROBE_SIZE, TEXT_PROBE_SIZE))
+    darkest, lightest = probe.getextrema()
+    if lightest - darkest < MIN_TEXT_CONTRAST or min(probe.size) < 3:
+        return False
+    
+    # FIND_EDGES responds to the image border too, so only the interior counts
+    edges = probe.filter(ImageFilter.FIND_EDGES).crop((1, 1, probe.width - 1, probe.height - 1))
+    edge_pixels = sum(edges.histogram()[TEXT_EDGE_THRESHOLD:])
+    return edge_pixels >= MIN_TEXT_EDGE_DENSITY * edges.width * edges.height
+
+
+def _describe_image(image, file_path: Path, width: int, height: int) -> str:
+    """Describe an image without text from its EXIF metadata, for classification by filename and date."""
+    exif = image.getexif()
+    details = exif.get_ifd(ExifTags.IFD.Exif)
+    # The filename keeps descriptions of same-sized images without EXIF from
+    # being identical, which would let the classification cache hand every
+    # such image the first one's category and name
+    lines = [f"Image {file_path.name} without readable text ({width}x{height} pixels)."]
+    
+    date_taken = details.get(ExifTags.Base.DateTimeOriginal) or exif.get(ExifTags.Base.DateTime)
+    if date_taken:
+        lines.append(f"Date taken: {date_taken}")
+    camera = " ".join(str(exif[tag]).strip() for tag in (ExifTags.Base.Make, ExifTags.Base.Model) if exif.get(tag))
+    if camera:
+        lines.append(f"Camera: {camera}")
+    description = exif.get(ExifTags.Base.ImageDescription)
+    if description:
+        lines.append(f"Description: {str(description).strip()}")
+    return "\n".join(lines)
+
+
+def _ocr_image(image) -> str:
+    """Run OCR in-process with tesserocr if installed, otherwise via the pytesseract subprocess."""
+    if tesserocr:
+        api = _get_ocr_api()
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    return pytesseract.image_to_string(image, config=OCR_CONFIG)
+
+
+def _get_ocr_api():
+    """Return this thread's tesserocr API, creating it on first use."""
+    api = getattr(_ocr_state, 'api', None)
+    if api is None:
+        # Same engine and page segmentation as OCR_CONFIG
+        api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_BLOCK, oem=tesserocr.OEM.LSTM_ONLY)
+        _ocr_state.api = api
+    return api
+
+
+def _prepare_image_for_ocr(image):
+    """Convert an image to grayscale and downscale it to OCR_MAX_DIMENSION."""
+    # For JPEGs, decode straight to grayscale at a reduced scale instead of
+    # materializing the full-resolution bitmap first (no-op for other formats)
+    image.draft('L', (OCR_MAX_DIMENSION, OCR_MAX_DIMENSION))
+    if image.mode != 'L':
+        image = image.convert('L')
+    if max(image.size) > OCR_MAX_DIMENSION:
+        image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.Resampling.LANCZOS)
+    return image
+
+
+def set_pdf_extractor(name: str):
+    """Choose the PDF text backend, one of PDF_EXTRACTORS."""
+    global _pdf_extractor
+    if name not in PDF_EXTRACTORS:
+        raise ValueError(f"Unknown PDF extractor: {name}")
+    if name != 'auto' and name not in dict(_available_pdf_extractors()):
+        raise ValueError(f"PDF extractor {name} is not installed")
+    _pdf_extractor = name
+
+
+def _available_pdf_extractors() -> List[Tuple[str, Callable[[Path], str]]]:
+    """Return the installed PDF backends, fastest first."""
+    available = []
+    if pdfium:
+        available.append(('pdfium', _extract_pdf_text_pdfium))
+    if fitz:
+        available.append(('fitz', _extract_pdf_text_fitz))
+    if PDFTOTEXT:
+        available.append(('pdftotext', _extract_pdf_text_pdftotext))
+    if pdf_extract_text:
+        available.append(('pdfminer', _extract_pdf_text_pdfminer))
+    return available
+
+
+def _pdf_extractors() -> List[Tuple[str, Callable[[Path], str]]]:
+    """Return the PDF backends to try, in order, for the current setting."""
+    available = _available_pdf_extractors()
+    if _pdf_extractor != 'auto':
+        return [(name, extract) for name, extract in available if name == _pdf_extractor]
+    
+    # Fastest backend, then pdfminer as the fallback for short output
+    extractors = available[:1]
+    if len(available) > 1 and available[-1][0] == 'pdfminer':
+        extractors.append(available[-1])
+    return extractors
+
+
 def extract_text_from_pdf(file_path: Path) -> Optional[str]:
-    """Extract text from PDF."""
-    if not pdf_extract_text:
-        logger.warning("PDF extraction dependencies not available. Install pdfminer.six.")
+    """Extract text from PDF with the fastest available backend, falling back to pdfminer."""
+    extractors = _pdf_extractors()
+    if not extractors:
+        logger.warning("PDF extraction dependencies not available. Install PyMuPDF, poppler-utils, "
+                       "pypdfium2 or pdfminer.six.")
         return None
     
-    try:
-        text = pdf_extract_text(str(file_path))
-        return text.strip() if text else None
-    except Exception as e:
-        logger.error(f"Error extracting text from PDF {file_path}: {e}")
-        return None
+    text = None
+    last_name = extractors[-1][0]
+    for name, extract in extractors:
+        try:
+            text = extract(file_path)
+        except Exception as e:
+            if name == last_name:
+                logger.error(f"Error extracting text from PDF {file_path}: {e}")
+                return None
+            logger.debug("%s could not read %s, falling back to %s: %s", name, file_path, last_name, e)
+            continue
+        # Output this short (e.g. from a scanned PDF) is retried with the fallback
+        if text and len(text.strip()) >= MIN_PDF_TEXT_LENGTH:
+            break
+    
+    return text.strip() if text else None
+
+
+def _extract_pdf_text_fitz(file_path: Path) -> str:
+    """Extract text with PyMuPDF, stopping once MAX_EXTRACT_CHARS are gathered."""
+    with _fitz_lock, fitz.open(str(file_path)) as pdf:
+        pages = []
+        length = 0
+        for index in range(min(len(pdf), MAX_PDF_PAGES)):
+            pages.append(pdf[index].get_text())
+            length += len(pages[-1])
+            if length >= MAX_EXTRACT_CHARS:
+                break
+        return "\n".join(pages)
+
+
+def _extract_pdf_text_pdftotext(file_path: Path) -> str:
+    """Extract text with poppler's pdftotext command, reading at most MAX_PDF_PAGES."""
+    completed = subprocess.run(
+        [PDFTOTEXT, '-l', str(MAX_PDF_PAGES), '-enc', 'UTF-8', str(file_path), '-'],
+        capture_output=True, timeout=PDFTOTEXT_TIMEOUT, check=True
+    )
+    return completed.stdout.decode('utf-8', errors='replace')
+
+
+def _extract_pdf_text_pdfium(file_path: Path) -> str:
+    """Extract text with pypdfium2, stopping once MAX_EXTRACT_CHARS are gathered."""
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(str(file_path))
+        try:
+            pages = []
+            length = 0
+            for index in range(min(len(pdf), MAX_PDF_PAGES)):
+                page = pdf[index]
+                textpage = page.get_textpage()
+                pages.append(textpage.get_text_bounded())
+                textpage.close()
+                page.close()
+                length += len(pages[-1])
+                if length >= MAX_EXTRACT_CHARS:
+                    break
+            return "\n".join(pages)
+        finally:
+            pdf.close()
+
+
+def _extract_pdf_text_pdfminer(file_path: Path) -> str:
+    """Extract text with pdfminer, reading at most MAX_PDF_PAGES."""
+    return pdf_extract_text(str(file_path), maxpages=MAX_PDF_PAGES)
 
 
 def extract_text_from_docx(file_path: Path) -> Optional[str]:
@@ -79,7 +324,14 @@ def extract_text_from_docx(file_path: Path) -> Optional[str]:
     
     try:
         doc = Document(file_path)
-        text = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
+        paragraphs = []
+        length = 0
+        for paragraph in doc.paragraphs:
+            paragraphs.append(paragraph.text)
+            length += len(paragraph.text) + 1
+            if length >= MAX_EXTRACT_CHARS:
+                break
+        text = '\n'.join(paragraphs)
         return text.strip() if text else None
     except Exception as e:
         logger.error(f"Error extracting text from DOCX {file_path}: {e}")
@@ -90,7 +342,8 @@ def extract_text_from_txt(file_path: Path) -> Optional[str]:
     """Extract text from plain text file."""
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
+            # Extra margin so leading whitespace stripped below doesn't eat into the budget
+            text = f.read(MAX_EXTRACT_CHARS * 2)
         return text.strip() if text else None
     except Exception as e:
         logger.error(f"Error reading text file {file_path}: {e}")
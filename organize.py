@@ -5,30 +5,21 @@ Smart File Organizer - Main CLI entrypoint
 Usage: python organize.py <input_folder> <output_folder> [options]
 """
 import argparse
+import hashlib
 import logging
 import os
+import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import asdict, dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterable, Iterator, Pattern
 
-try:
-    from dotenv import load_dotenv
-except ImportError:
-    load_dotenv = None
-
-try:
-    from rich.console import Console
-    from rich.progress import Progress, SpinnerColumn, TextColumn
-    from rich.table import Table
-    from rich.panel import Panel
-except ImportError:
-    Console = None
-    Progress = None
-
-from extractors import extract_text
-from classifier import FileClassifier
-from renamer import FileRenamer
+# rich, dotenv, the extractor backends, the caches and the Anthropic client
+# are imported on first use so that `--help` and small runs start quickly.
+from renamer import FileRenamer, copy_file
 
 # Set up logging
 logging.basicConfig(
@@ -37,147 +28,530 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Files are dominated by I/O waits (OCR, API round-trip, disk copy) that
+# release the GIL, so the pool runs two threads per CPU.
+DEFAULT_MAX_WORKERS = (os.cpu_count() or 4) * 2
+
+# Text extraction is mostly CPU-bound (OCR, PDF parsing) and gets its own
+# pool, one thread per CPU.
+DEFAULT_EXTRACT_WORKERS = os.cpu_count() or 4
+
+SUPPORTED_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif',
+                                  '.pdf', '.docx', '.doc', '.txt'})
+# Matches names ending in a supported extension, in any case
+_SUPPORTED_NAME_RE = re.compile(
+    r'\.(?:' + '|'.join(re.escape(ext[1:]) for ext in sorted(SUPPORTED_EXTENSIONS)) + r')\Z',
+    re.IGNORECASE
+)
+
+# Copying failed files into _Errors is disk-bound, so a few threads suffice
+ERROR_COPY_WORKERS = 8
+
+# Below this many files the Message Batches API's queueing delay outweighs
+# its lower price, so --batch falls back to online requests.
+BATCH_API_MIN_FILES = 100
+
+# Minimum seconds between progress description updates
+PROGRESS_UPDATE_INTERVAL = 0.1
+
+# Duplicate input files are spotted by size plus a hash of their first and
+# last DEDUPE_SAMPLE_BYTES; only files that match on that are hashed in full.
+DEDUPE_SAMPLE_BYTES = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _walk(root: str, name_pattern: Pattern[str], skip_dir: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield paths of files under root whose name matches name_pattern, walking
+    with an explicit os.scandir stack and the type information it already
+    has instead of a stat() per entry. The folder skip_dir (by identity, so
+    any path spelling matches) is not descended into.
+    """
+    matches = name_pattern.search
+    skip = os.stat(skip_dir) if skip_dir else None
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        # Only directories sharing skip_dir's inode number need a stat
+                        if not (skip and entry.inode() == skip.st_ino
+                                and entry.stat(follow_symlinks=False).st_dev == skip.st_dev):
+                            stack.append(entry.path)
+                        continue
+                    if matches(entry.name) and entry.is_file():
+                        yield entry.path
+        except PermissionError as e:
+            logger.warning(f"Skipping unreadable folder {folder}: {e}")
+
+
+def _quick_digest(path: str, size: int) -> str:
+    """Hash a file's size and its first and last DEDUPE_SAMPLE_BYTES."""
+    digest = hashlib.blake2b(str(size).encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(DEDUPE_SAMPLE_BYTES))
+        if size > 2 * DEDUPE_SAMPLE_BYTES:
+            f.seek(-DEDUPE_SAMPLE_BYTES, os.SEEK_END)
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _full_digest(path: str) -> str:
+    """Hash a file's entire contents."""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass(slots=True)
+class FileResult:
+    """Outcome of processing one input file."""
+    original_name: str
+    original_path: Path
+    success: bool = False
+    category: Optional[str] = None
+    new_filename: Optional[str] = None
+    new_path: Optional[Path] = None
+    error_message: Optional[str] = None
+    # Set when the file was organized from an identical file instead of
+    # going through the pipeline itself
+    duplicate_of: Optional[Path] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the result as a dictionary (the format used before FileResult)."""
+        return asdict(self)
+
+
+_console = None
+
+
+def _get_console():
+    """Return the shared rich console, importing rich on first use, or None if it isn't installed."""
+    global _console
+    if _console is None:
+        try:
+            from rich.console import Console
+        except ImportError:
+            _console = False
+        else:
+            _console = Console()
+    return _console or None
+
+
+class _NullProgress:
+    """Stand-in for rich's Progress when rich is not installed."""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def add_task(self, description: str, total: Optional[float] = None) -> int:
+        return 0
+    
+    def update(self, task: int, **kwargs):
+        pass
+    
+    def advance(self, task: int, advance: float = 1):
+        pass
+
 
 class SmartFileOrganizer:
     """Main organizer class that coordinates all components."""
     
-    def __init__(self, api_key: str, output_path: Path, copy_mode: bool = True, dry_run: bool = False):
-        self.classifier = FileClassifier(api_key)
+    def __init__(self, api_key: str, output_path: Path, copy_mode: bool = True, dry_run: bool = False,
+                 max_workers: int = DEFAULT_MAX_WORKERS, use_batch_api: bool = False, use_cache: bool = True,
+                 group_prompts: bool = False, extract_workers: int = DEFAULT_EXTRACT_WORKERS,
+                 pdf_extractor: str = 'auto', dedupe: bool = True, sort_files: bool = False):
+        from classifier import FileClassifier
+        
+        if pdf_extractor != 'auto':
+            from extractors import set_pdf_extractor
+            set_pdf_extractor(pdf_extractor)
+        
+        # Each classify worker may have one API request in flight
+        self.max_workers = max(1, max_workers)
+        if use_cache:
+            from cache import ClassificationCache, FileCache
+            self.classifier = FileClassifier(api_key, max_concurrent_requests=self.max_workers,
+                                             cache=ClassificationCache())
+            self.file_cache = FileCache()
+        else:
+            self.classifier = FileClassifier(api_key, max_concurrent_requests=self.max_workers)
+            self.file_cache = None
         self.renamer = FileRenamer(output_path)
         self.copy_mode = copy_mode
         self.dry_run = dry_run
-        self.console = Console() if Console else None
+        self.extract_workers = max(1, extract_workers)
+        self.use_batch_api = use_batch_api
+        self.group_prompts = group_prompts
+        self.console = _get_console()
+        self.dedupe = dedupe
+        self.sort_files = sort_files
+        # Files skipped as identical to an earlier file, by that earlier file
+        self._duplicates: Dict[Path, List[Path]] = {}
     
-    def organize_folder(self, input_folder: Path) -> List[Dict[str, Any]]:
+    def organize_folder(self, input_folder: Path) -> List[FileResult]:
         """
         Organize all files in the input folder.
         
         Returns:
-            List of dictionaries containing processing results for each file
+            List of FileResult objects describing the outcome for each file
         """
         if not input_folder.exists() or not input_folder.is_dir():
             raise ValueError(f"Input folder does not exist or is not a directory: {input_folder}")
         
-        # Find all files to process
-        files_to_process = self._find_files_to_process(input_folder)
+        # Files are discovered lazily; the phased modes need the full list up
+        # front, the default online mode starts processing as they are found
+        # (in directory order unless sorting was asked for)
+        files = self._find_files_to_process(input_folder)
+        # Sort before deduplicating so the copy kept as the primary (and given
+        # the unsuffixed name) doesn't depend on directory order
+        if self.sort_files:
+            files = sorted(files, key=os.fspath)
+        if self.dedupe:
+            files = self._skip_duplicates(files)
+        
+        if self.use_batch_api or self.group_prompts:
+            files_to_process = list(files)
+            if not files_to_process:
+                self._print("No supported files found in the input folder.")
+                return []
+            
+            self._print(f"Found {len(files_to_process)} files to process")
+            
+            if self.use_batch_api and len(files_to_process) >= BATCH_API_MIN_FILES:
+                processed_files = self._process_in_phases(
+                    files_to_process,
+                    lambda items, _: self.classifier.classify_files_batch(items),
+                    "Submitting {count} files to the Message Batches API (this can take a while)..."
+                )
+            elif self.group_prompts:
+                processed_files = self._process_in_phases(
+                    files_to_process,
+                    self._classify_in_groups,
+                    "Classifying {count} files in groups..."
+                )
+            else:
+                processed_files = self._process_online(files_to_process)
+        else:
+            processed_files = self._process_online(files)
+            if not processed_files:
+                self._print("No supported files found in the input folder.")
+                return []
         
-        if not files_to_process:
-            self._print("No supported files found in the input folder.")
-            return []
+        if self._duplicates:
+            processed_files.extend(self._organize_duplicates(processed_files))
         
-        self._print(f"Found {len(files_to_process)} files to process")
+        # Organize failed files into error folders
+        if not self.dry_run:
+            self._organize_failed_files(processed_files)
         
+        return processed_files
+    
+    def _process_online(self, files_to_process: Iterable[Path]) -> List[FileResult]:
+        """Run every file through the full pipeline, one API request per file."""
         processed_files = []
+        successful = 0
         
-        # Process files with progress bar if rich is available
-        if self.console and Progress:
-            with Progress(
-                SpinnerColumn(),
-                TextColumn("[progress.description]{task.description}"),
-                console=self.console
-            ) as progress:
-                task = progress.add_task("Processing files...", total=len(files_to_process))
+        # Text extraction (CPU-bound OCR/parsing) and classification (network
+        # waits) run in separate pools so slow OCR never starves API requests.
+        # Results are consumed on the main thread so progress output never
+        # races between workers.
+        extract_executor = ThreadPoolExecutor(max_workers=self.extract_workers)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            with self._progress() as progress:
+                task = progress.add_task("Processing files...", total=None)
                 
-                for i, file_path in enumerate(files_to_process, 1):
-                    progress.update(task, description=f"Processing {i}/{len(files_to_process)} files")
-                    result = self._process_single_file(file_path)
+                results = self._iter_results(extract_executor, executor, files_to_process)
+                last_update = 0.0
+                for i, result in enumerate(results, 1):
                     processed_files.append(result)
+                    successful += result.success
                     progress.advance(task)
                     
+                    # Cache hits finish far faster than the display can redraw
+                    now = time.monotonic()
+                    if now - last_update >= PROGRESS_UPDATE_INTERVAL:
+                        progress.update(task, description=f"Processed {i} files")
+                        last_update = now
+                    
                     # Print periodic updates for large batches
-                    if i % 50 == 0 or i == len(files_to_process):
-                        successful = len([f for f in processed_files if f['success']])
-                        failed = len([f for f in processed_files if not f['success']])
-                        self._print(f"Progress: {i}/{len(files_to_process)} processed ({successful} successful, {failed} failed)")
-        else:
-            # Fallback without progress bar
-            for i, file_path in enumerate(files_to_process, 1):
-                result = self._process_single_file(file_path)
-                processed_files.append(result)
-                
-                # Print periodic updates
-                if i % 50 == 0 or i == len(files_to_process):
-                    successful = len([f for f in processed_files if f['success']])
-                    failed = len([f for f in processed_files if not f['success']])
-                    self._print(f"Progress: {i}/{len(files_to_process)} processed ({successful} successful, {failed} failed)")
-        
-        # Organize failed files into error folders
-        if not self.dry_run:
-            self._organize_failed_files(processed_files)
+                    if i % 50 == 0:
+                        self._print(f"Progress: {i} processed ({successful} successful, {i - successful} failed)")
+            
+                progress.update(task, description=f"Processed {len(processed_files)} files")
+            
+            total = len(processed_files)
+            if total % 50:
+                self._print(f"Progress: {total} processed ({successful} successful, {total - successful} failed)")
+        finally:
+            # On Ctrl-C or an unexpected error, don't start files that are still queued
+            extract_executor.shutdown(wait=True, cancel_futures=True)
+            executor.shutdown(wait=True, cancel_futures=True)
         
         return processed_files
     
-    def _find_files_to_process(self, input_folder: Path) -> List[Path]:
-        """Find all supported files in the input folder."""
-        supported_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif', 
-                              '.pdf', '.docx', '.doc', '.txt'}
+    def _iter_results(self, extract_executor: ThreadPoolExecutor, executor: ThreadPoolExecutor,
+                      files_to_process: Iterable[Path]) -> Iterator[FileResult]:
+        """
+        Extract files on extract_executor as they are produced, hand each
+        extracted file to executor for classification and organization, and
+        yield results in completion order. At most a few files per worker are
+        in flight, so extraction of later files overlaps classification of
+        earlier ones without running arbitrarily far ahead.
+        """
+        max_in_flight = (self.extract_workers + self.max_workers) * 2
+        extracting = {}
+        finishing = set()
+        
+        def drain(block_until: int) -> Iterator[FileResult]:
+            while len(extracting) + len(finishing) > block_until:
+                done, _ = wait(set(extracting) | finishing, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in finishing:
+                        finishing.remove(future)
+                        yield future.result()
+                        continue
+                    
+                    file_path = extracting.pop(future)
+                    result, extracted_text = future.result()
+                    if extracted_text:
+                        finishing.add(executor.submit(self._classify_and_organize, file_path, result, extracted_text))
+                    else:
+                        yield result
+        
+        for file_path in files_to_process:
+            extracting[extract_executor.submit(self._extract_file, file_path)] = file_path
+            yield from drain(max_in_flight - 1)
+        
+        yield from drain(0)
+    
+    def _classify_in_groups(self, items: List[Tuple[str, str]],
+                            executor: ThreadPoolExecutor) -> List[Optional[Dict[str, str]]]:
+        """Classify items with grouped prompts, running the groups concurrently."""
+        results: List[Optional[Dict[str, str]]] = [None] * len(items)
+        groups = self.classifier.plan_groups(items)
         
-        files = []
-        for file_path in input_folder.rglob('*'):
-            if file_path.is_file() and file_path.suffix.lower() in supported_extensions:
-                files.append(file_path)
+        group_results = executor.map(lambda group: self.classifier.classify_batch([items[i] for i in group]), groups)
+        for group, classifications in zip(groups, group_results):
+            for index, classification in zip(group, classifications):
+                results[index] = classification
         
-        return sorted(files)
+        return results
+    
+    def _find_files_to_process(self, input_folder: Path) -> Iterable[Path]:
+        """
+        Find all supported files in the input folder, yielding them as they
+        are found. Files the run itself writes are never picked up: an output
+        folder inside the input folder is skipped, and when the output folder
+        contains the input folder the walk finishes before processing starts.
+        """
+        output_folder = self.renamer.output_base_path.resolve()
+        input_folder = input_folder.resolve()
+        paths = _walk(str(input_folder), _SUPPORTED_NAME_RE, str(output_folder))
+        if output_folder == input_folder or output_folder in input_folder.parents:
+            return [Path(path) for path in paths]
+        return (Path(path) for path in paths)
     
-    def _process_single_file(self, file_path: Path) -> Dict[str, Any]:
+    def _process_single_file(self, file_path: Path) -> FileResult:
         """Process a single file through the entire pipeline."""
-        result = {
-            'original_name': file_path.name,
-            'original_path': file_path,
-            'success': False,
-            'category': None,
-            'new_filename': None,
-            'new_path': None,
-            'error_message': None
-        }
+        # Step 1: Extract text
+        result, extracted_text = self._extract_file(file_path)
         
+        # Steps 2 and 3: Classify and organize file (unless dry run)
+        if extracted_text:
+            self._classify_and_organize(file_path, result, extracted_text)
+        
+        return result
+    
+    def _extract_file(self, file_path: Path) -> Tuple[FileResult, Optional[str]]:
+        """Extract text from a file, returning a new result alongside the text (None on failure)."""
+        result = FileResult(file_path.name, file_path)
+        try:
+            return result, self._extract_step(file_path, result)
+        except Exception as e:
+            result.error_message = f"Unexpected error: {e}"
+            logger.exception("Error processing %s", file_path)
+            return result, None
+    
+    def _classify_and_organize(self, file_path: Path, result: FileResult, extracted_text: str) -> FileResult:
+        """Classify an extracted file and organize it, filling in result."""
         try:
-            # Step 1: Extract text
-            file_type, extracted_text = extract_text(file_path)
+            classification = self._classify_step(file_path, extracted_text)
+            self._organize_step(file_path, result, classification, extracted_text)
+        except Exception as e:
+            result.error_message = f"Unexpected error: {e}"
+            logger.exception("Error processing %s", file_path)
+        
+        return result
+    
+    def _extract_step(self, file_path: Path, result: FileResult) -> Optional[str]:
+        """Extract text from a file, recording an error in result on failure."""
+        if self.file_cache:
+            extracted_text = self.file_cache.get_text(file_path)
+            if extracted_text:
+                return extracted_text
+        
+        from extractors import extract_text
+        file_type, extracted_text = extract_text(file_path)
+        
+        if not extracted_text:
+            result.error_message = f"Could not extract text from {file_type} file"
+            return None
+        
+        if self.file_cache:
+            self.file_cache.put_text(file_path, extracted_text)
+        return extracted_text
+    
+    def _classify_step(self, file_path: Path, extracted_text: str) -> Optional[Dict[str, str]]:
+        """Classify a file, reusing the result from an earlier run if it hasn't changed."""
+        if self.file_cache:
+            classification = self.file_cache.get_classification(file_path, self.classifier.model)
+            if classification:
+                return classification
+        
+        classification = self.classifier.classify_file(file_path.name, extracted_text)
+        
+        if classification and self.file_cache:
+            self.file_cache.put_classification(file_path, self.classifier.model, classification)
+        return classification
+    
+    def _organize_step(self, file_path: Path, result: FileResult,
+                       classification: Optional[Dict[str, str]], extracted_text: str):
+        """Move or copy a classified file into place and record the outcome in result."""
+        if not classification:
+            result.error_message = "Could not classify file content"
+            return
+        
+        result.category = classification['category']
+        result.new_filename = classification['new_filename']
+        
+        if not self.dry_run:
+            success, new_path, message = self.renamer.organize_file(
+                file_path, 
+                classification['category'], 
+                classification['new_filename'],
+                self.copy_mode,
+                extracted_text
+            )
             
-            if not extracted_text:
-                result['error_message'] = f"Could not extract text from {file_type} file"
-                return result
+            if success:
+                result.success = True
+                result.new_path = new_path
+            else:
+                result.error_message = message
+        else:
+            # Dry run - just simulate success
+            result.success = True
+            result.new_path = Path("DRY_RUN") / classification['category'] / f"{classification['new_filename']}{file_path.suffix}"
+    
+    def _process_in_phases(self, files_to_process: List[Path],
+                           classify_all: Callable[[List[Tuple[str, str]], ThreadPoolExecutor], List[Optional[Dict[str, str]]]],
+                           description: str) -> List[FileResult]:
+        """
+        Process files in three phases (extract all, classify all, organize all)
+        so classify_all can combine many files into fewer API requests.
+        """
+        def organize(item: Tuple[Path, FileResult, Optional[str], Optional[Dict[str, str]]]) -> FileResult:
+            file_path, result, extracted_text, classification = item
+            if extracted_text:
+                try:
+                    self._organize_step(file_path, result, classification, extracted_text)
+                except Exception as e:
+                    result.error_message = f"Unexpected error: {e}"
+                    logger.exception("Error processing %s", file_path)
+            return result
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self._print("Extracting text...")
+            extracted = list(executor.map(self._extract_file, files_to_process))
             
-            # Step 2: Classify file
-            classification = self.classifier.classify_file(file_path.name, extracted_text)
+            classifications: List[Optional[Dict[str, str]]] = [None] * len(files_to_process)
+            pending = []
+            for index, (file_path, (_, text)) in enumerate(zip(files_to_process, extracted)):
+                if not text:
+                    continue
+                classifications[index] = self.file_cache.get_classification(file_path, self.classifier.model) if self.file_cache else None
+                if not classifications[index]:
+                    pending.append(index)
             
-            if not classification:
-                result['error_message'] = "Could not classify file content"
-                return result
+            self._print(description.format(count=len(pending)))
+            batch_results = classify_all([(files_to_process[i].name, extracted[i][1]) for i in pending], executor)
+            for index, classification in zip(pending, batch_results):
+                classifications[index] = classification
+                if classification and self.file_cache:
+                    self.file_cache.put_classification(files_to_process[index], self.classifier.model, classification)
             
-            result['category'] = classification['category']
-            result['new_filename'] = classification['new_filename']
+            self._print("Organizing files...")
+            return list(executor.map(organize, [
+                (file_path, result, text, classification)
+                for file_path, (result, text), classification in zip(files_to_process, extracted, classifications)
+            ]))
+    
+    def _skip_duplicates(self, files: Iterable[Path]) -> Iterator[Path]:
+        """Yield one file per group of identical files, recording the rest in self._duplicates."""
+        primaries_by_digest: Dict[str, List[Path]] = {}
+        full_digests: Dict[Path, str] = {}
+        
+        for file_path in files:
+            try:
+                size = os.stat(file_path).st_size
+                candidates = primaries_by_digest.setdefault(_quick_digest(file_path, size), [])
+                primary = None
+                if candidates:
+                    # The quick digest covers small files entirely
+                    if size <= 2 * DEDUPE_SAMPLE_BYTES:
+                        primary = candidates[0]
+                    else:
+                        digest = full_digests[file_path] = _full_digest(file_path)
+                        for candidate in candidates:
+                            if candidate not in full_digests:
+                                full_digests[candidate] = _full_digest(candidate)
+                            if full_digests[candidate] == digest:
+                                primary = candidate
+                                break
+            except OSError as e:
+                logger.debug("Could not hash %s for duplicate detection: %s", file_path, e)
+                yield file_path
+                continue
             
-            # Step 3: Organize file (unless dry run)
-            if not self.dry_run:
-                success, new_path, message = self.renamer.organize_file(
-                    file_path, 
-                    classification['category'], 
-                    classification['new_filename'],
-                    self.copy_mode,
-                    extracted_text
-                )
-                
-                if success:
-                    result['success'] = True
-                    result['new_path'] = new_path
-                else:
-                    result['error_message'] = message
+            if primary is None:
+                candidates.append(file_path)
+                yield file_path
             else:
-                # Dry run - just simulate success
-                result['success'] = True
-                result['new_path'] = Path("DRY_RUN") / classification['category'] / f"{classification['new_filename']}{file_path.suffix}"
-            
-        except Exception as e:
-            result['error_message'] = f"Unexpected error: {e}"
-            logger.exception(f"Error processing {file_path}")
-        
-        return result
+                logger.debug("%s is identical to %s, organizing it alongside", file_path, primary)
+                self._duplicates.setdefault(primary, []).append(file_path)
+    
+    def _organize_duplicates(self, processed_files: List[FileResult]) -> List[FileResult]:
+        """Give every skipped duplicate the outcome of the identical file that was processed."""
+        duplicate_results = []
+        for primary in processed_files:
+            for file_path in self._duplicates.get(primary.original_path, ()):
+                result = FileResult(file_path.name, file_path, category=primary.category,
+                                    new_filename=primary.new_filename, error_message=primary.error_message,
+                                    duplicate_of=primary.original_path)
+                if primary.success and self.dry_run:
+                    result.success = True
+                    result.new_path = primary.new_path.with_name(f"{primary.new_filename}{file_path.suffix}")
+                elif primary.success:
+                    result.success, result.new_path, message = self.renamer.organize_duplicate(
+                        file_path, primary.new_path, primary.new_filename, self.copy_mode
+                    )
+                    if not result.success:
+                        result.error_message = message
+                duplicate_results.append(result)
+        return duplicate_results
     
-    def _organize_failed_files(self, processed_files: List[Dict[str, Any]]):
+    def _organize_failed_files(self, processed_files: List[FileResult]):
         """Organize failed files into appropriate error folders."""
-        failed_files = [f for f in processed_files if not f['success']]
+        failed_files = [f for f in processed_files if not f.success]
         
         if not failed_files:
             return
@@ -194,9 +568,10 @@ class SmartFileOrganizer:
             "processing_error": "Unexpected error"
         }
         
+        work = []
         for file_info in failed_files:
-            error_message = file_info['error_message'] or "Unknown error"
-            source_file = file_info['original_path']
+            error_message = file_info.error_message or "Unknown error"
+            source_file = file_info.original_path
             
             # Determine error category
             if "extract text" in error_message.lower():
@@ -210,27 +585,44 @@ class SmartFileOrganizer:
             
             # Create error subfolder
             error_subfolder = errors_folder / error_category
-            error_subfolder.mkdir(exist_ok=True)
+            self.renamer._ensure_folder(error_subfolder)
             
-            # Copy file to error folder
-            try:
-                if self.copy_mode:
-                    import shutil
-                    target_path = error_subfolder / source_file.name
-                    # Handle naming collisions
-                    target_path = self.renamer._handle_naming_collision(target_path)
-                    shutil.copy2(source_file, target_path)
-                    
-                    # Create error info file
-                    error_info_path = target_path.with_suffix(target_path.suffix + '.error_info.txt')
-                    with open(error_info_path, 'w', encoding='utf-8') as f:
-                        f.write(f"Original file: {source_file}\n")
-                        f.write(f"Error category: {error_category}\n")
-                        f.write(f"Error message: {error_message}\n")
-                        f.write(f"Processing date: {datetime.now().isoformat()}\n")
-                        
-            except Exception as e:
-                logger.error(f"Could not organize failed file {source_file}: {e}")
+            work.append((source_file, error_subfolder, error_category, error_message))
+        
+        # Copy file to error folder
+        if self.copy_mode:
+            with ThreadPoolExecutor(max_workers=ERROR_COPY_WORKERS) as executor:
+                list(executor.map(lambda item: self._copy_failed_file(*item), work))
+    
+    def _copy_failed_file(self, source_file: Path, error_subfolder: Path, error_category: str, error_message: str):
+        """Copy a failed file into its error folder alongside an error info file."""
+        try:
+            target_path = error_subfolder / source_file.name
+            # Handle naming collisions
+            target_path = self.renamer._handle_naming_collision(target_path)
+            copy_file(source_file, target_path)
+            
+            # Create error info file
+            error_info_path = target_path.with_suffix(target_path.suffix + '.error_info.txt')
+            with open(error_info_path, 'w', encoding='utf-8') as f:
+                f.write(f"Original file: {source_file}\n")
+                f.write(f"Error category: {error_category}\n")
+                f.write(f"Error message: {error_message}\n")
+                f.write(f"Processing date: {datetime.now().isoformat()}\n")
+                
+        except Exception as e:
+            logger.error(f"Could not organize failed file {source_file}: {e}")
+    
+    def _progress(self):
+        """Return a rich progress display if available, otherwise a no-op stand-in."""
+        if self.console:
+            from rich.progress import Progress, SpinnerColumn, TextColumn
+            return Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                console=self.console
+            )
+        return _NullProgress()
     
     def _print(self, message: str):
         """Print message using rich console if available, otherwise regular print."""
@@ -239,14 +631,15 @@ class SmartFileOrganizer:
         else:
             print(message)
     
-    def print_summary(self, processed_files: List[Dict[str, Any]]):
+    def print_summary(self, processed_files: List[FileResult]):
         """Print a summary of the processing results."""
         if not processed_files:
             self._print("No files were processed.")
             return
         
-        successful = [f for f in processed_files if f['success']]
-        failed = [f for f in processed_files if not f['success']]
+        successful = [f for f in processed_files if f.success]
+        failed = [f for f in processed_files if not f.success]
+        duplicates = sum(1 for f in processed_files if f.duplicate_of)
         
         # Print summary statistics
         summary_text = f"""
@@ -255,25 +648,28 @@ Processing Complete!
 Total files: {len(processed_files)}
 Successfully organized: {len(successful)}
 Failed: {len(failed)}
+Duplicates (organized from an identical file): {duplicates}
 Mode: {'DRY RUN' if self.dry_run else ('COPY' if self.copy_mode else 'MOVE')}
 """
         
         if self.console:
+            from rich.panel import Panel
             self.console.print(Panel(summary_text.strip(), title="Summary", border_style="green"))
         else:
             print(summary_text)
         
         # Print detailed results table
         if self.console and successful:
+            from rich.table import Table
             table = Table(title="Successfully Organized Files")
             table.add_column("Original Name", style="cyan")
             table.add_column("New Location", style="green")
             table.add_column("Category", style="yellow")
             
             for file_info in successful:
-                original = file_info['original_name']
-                new_path = str(file_info['new_path']) if file_info['new_path'] else "Unknown"
-                category = file_info['category'] or "Unknown"
+                original = file_info.original_name
+                new_path = str(file_info.new_path) if file_info.new_path else "Unknown"
+                category = file_info.category or "Unknown"
                 table.add_row(original, new_path, category)
             
             self.console.print(table)
@@ -282,8 +678,8 @@ Mode: {'DRY RUN' if self.dry_run else ('COPY' if self.copy_mode else 'MOVE')}
         if failed:
             self._print("\nFailed files:")
             for file_info in failed:
-                error_msg = file_info['error_message'] or "Unknown error"
-                self._print(f"  ❌ {file_info['original_name']}: {error_msg}")
+                error_msg = file_info.error_message or "Unknown error"
+                self._print(f"  ❌ {file_info.original_name}: {error_msg}")
 
 
 def main():
@@ -304,6 +700,25 @@ Examples:
     parser.add_argument('--api-key', help='Anthropic API key (or set ANTHROPIC_API_KEY env var)')
     parser.add_argument('--move', action='store_true', help='Move files instead of copying them')
     parser.add_argument('--dry-run', action='store_true', help='Show what would be done without actually moving files')
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f'Number of files to classify and organize concurrently, which is also the limit on '
+                             f'simultaneous API requests (default: {DEFAULT_MAX_WORKERS})')
+    parser.add_argument('--extract-workers', type=int, default=DEFAULT_EXTRACT_WORKERS,
+                        help=f'Number of files to extract text from concurrently (default: {DEFAULT_EXTRACT_WORKERS})')
+    parser.add_argument('--extractor', default='auto',
+                        help='PDF text backend: auto, pdfium, fitz, pdftotext or pdfminer '
+                             '(default: auto, the fastest one installed)')
+    parser.add_argument('--batch', action=argparse.BooleanOptionalAction, default=False,
+                        help=f'Classify with the Message Batches API (half price, results can take up to 24h) '
+                             f'when there are at least {BATCH_API_MIN_FILES} files')
+    parser.add_argument('--group-prompts', action='store_true',
+                        help='Classify several small files per API request to save prompt tokens')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-extract and re-classify every file instead of reusing results from earlier runs')
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='Process identical files separately instead of organizing duplicates from the first copy')
+    parser.add_argument('--sorted', action='store_true',
+                        help='Process files in path order instead of the order they are found')
     parser.add_argument('--verbose', '-v', action='store_true', help='Enable verbose logging')
     
     args = parser.parse_args()
@@ -312,9 +727,18 @@ Examples:
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
     
-    # Load environment variables
-    if load_dotenv:
-        load_dotenv()
+    # Load environment variables from the nearest .env at or above this
+    # script's folder, where load_dotenv() itself would look
+    script_dir = Path(__file__).resolve().parent
+    env_path = next((folder / '.env' for folder in (script_dir, *script_dir.parents)
+                     if (folder / '.env').is_file()), None)
+    if env_path:
+        try:
+            from dotenv import load_dotenv
+        except ImportError:
+            logger.warning(f"Found {env_path} but python-dotenv is not installed, ignoring it")
+        else:
+            load_dotenv(env_path)
     
     # Get API key
     api_key = args.api_key or os.getenv('ANTHROPIC_API_KEY')
@@ -328,7 +752,15 @@ Examples:
             api_key=api_key,
             output_path=args.output_folder,
             copy_mode=not args.move,
-            dry_run=args.dry_run
+            dry_run=args.dry_run,
+            max_workers=args.workers,
+            use_batch_api=args.batch,
+            use_cache=not args.no_cache,
+            group_prompts=args.group_prompts,
+            extract_workers=args.extract_workers,
+            pdf_extractor=args.extractor,
+            dedupe=not args.no_dedupe,
+            sort_files=args.sorted
         )
         
         # Process files
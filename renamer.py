@@ -2,13 +2,79 @@
 Rules for safe filenames and folder paths.
 """
 import os
+import re
 import shutil
+import sys
+import threading
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import Dict, Set, Tuple, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+_PROBLEMATIC_CHARS = '/\\:*?"<>|'
+_FOLDER_TRANSLATION = str.maketrans({c: '_' for c in _PROBLEMATIC_CHARS})
+_FILENAME_TRANSLATION = str.maketrans({c: '_' for c in _PROBLEMATIC_CHARS + ' '})
+_UNDERSCORE_RUN_RE = re.compile(r'_+')
+
+# Copy-on-write clones make a copy on the same btrfs/XFS/APFS volume
+# practically free; anything else falls back to a regular copy.
+if sys.platform.startswith('linux'):
+    import fcntl
+    FICLONE = 0x40049409
+    _clonefile = None
+elif sys.platform == 'darwin':
+    import ctypes
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _clonefile = getattr(_libc, 'clonefile', None)
+    if _clonefile is not None:
+        _clonefile.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32]
+else:
+    _clonefile = None
+
+
+def _clone_file(source: Path, target: Path) -> bool:
+    """Try to reflink source to target, returning False if the filesystem can't."""
+    try:
+        if sys.platform.startswith('linux'):
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        if _clonefile is not None:
+            return _clonefile(os.fsencode(source), os.fsencode(target), 0) == 0
+    except OSError:
+        pass
+    return False
+
+
+def _fast_copy(source: Path, target: Path) -> bool:
+    """Copy file contents inside the kernel with copy_file_range, returning False if unsupported."""
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            src_fd, dst_fd = src.fileno(), dst.fileno()
+            os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            remaining = os.fstat(src_fd).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src_fd, dst_fd, remaining)
+                if copied == 0:
+                    # Some filesystems report no progress instead of an error
+                    return False
+                remaining -= copied
+        return True
+    except OSError:
+        # e.g. EXDEV across filesystems on older kernels, or EINVAL/ENOSYS
+        return False
+
+
+def copy_file(source: Path, target: Path):
+    """Copy a file with its metadata, cloning it when the filesystem supports it."""
+    if _clone_file(source, target) or _fast_copy(source, target):
+        shutil.copystat(source, target)
+    else:
+        shutil.copy2(source, target)
+
 
 class FileRenamer:
     """Handles file renaming and organization."""
@@ -16,6 +82,20 @@ class FileRenamer:
     def __init__(self, output_base_path: Path):
         self.output_base_path = Path(output_base_path)
         self.output_base_path.mkdir(parents=True, exist_ok=True)
+        # Names present in (or already handed out for) each target folder,
+        # listed once per folder so collisions never need a stat per
+        # candidate name and concurrent workers never pick the same target.
+        # Names only collide within a folder, so each folder has its own lock.
+        # Folders and names are compared casefolded, since on case-insensitive
+        # filesystems (APFS, NTFS) "Receipt.JPG" and "receipt.jpg" are one file
+        # and "Receipts" and "receipts" one folder.
+        self._dir_listings: Dict[str, Set[str]] = {}
+        self._listed_folders: Set[Path] = set()
+        self._folder_locks: Dict[str, threading.Lock] = {}
+        self._folder_locks_guard = threading.Lock()
+        # Category folders already created this run; categories repeat, so
+        # each is created once rather than once per file.
+        self._ensured_folders: Set[Path] = set()
     
     def organize_file(self, source_file: Path, category: str, new_filename: str, 
                      copy_mode: bool = True, extracted_text: Optional[str] = None) -> Tuple[bool, Optional[Path], str]:
@@ -27,7 +107,7 @@ class FileRenamer:
             category: Category folder name
             new_filename: New filename (without extension)
             copy_mode: If True, copy file; if False, move file
-            extracted_text: Optional extracted text to save alongside the file
+            extracted_text: Optional extracted text excerpt to save alongside the file
             
         Returns:
             Tuple of (success, new_file_path, message)
@@ -35,7 +115,7 @@ class FileRenamer:
         try:
             # Create category folder
             category_folder = self.output_base_path / self._sanitize_folder_name(category)
-            category_folder.mkdir(parents=True, exist_ok=True)
+            self._ensure_folder(category_folder)
             
             # Preserve original file extension
             original_extension = source_file.suffix
@@ -48,7 +128,7 @@ class FileRenamer:
             
             # Copy or move the file
             if copy_mode:
-                shutil.copy2(source_file, target_path)
+                copy_file(source_file, target_path)
                 operation = "copied"
             else:
                 shutil.move(str(source_file), target_path)
@@ -65,6 +145,8 @@ class FileRenamer:
                         f.write(f"Extracted text from: {source_file.name}\n")
                         f.write(f"Organized as: {target_path.name}\n")
                         f.write(f"Category: {category}\n")
+                        f.write("Note: excerpt only - extraction stops after the start of the document "
+                                "used for classification\n")
                         f.write("-" * 50 + "\n\n")
                         f.write(extracted_text)
                 except Exception as e:
@@ -78,38 +160,60 @@ class FileRenamer:
             logger.error(error_msg)
             return False, None, error_msg
     
+    def organize_duplicate(self, source_file: Path, organized_path: Path, new_filename: str,
+                           copy_mode: bool = True) -> Tuple[bool, Optional[Path], str]:
+        """
+        Organize a file next to an identical file that was already organized
+        to organized_path, hardlinking to it instead of copying when possible.
+        
+        Returns:
+            Tuple of (success, new_file_path, message)
+        """
+        try:
+            target_path = organized_path.parent / f"{self._sanitize_filename(new_filename)}{source_file.suffix}"
+            target_path = self._handle_naming_collision(target_path)
+            
+            if copy_mode:
+                try:
+                    os.link(organized_path, target_path)
+                    operation = "linked"
+                except OSError:
+                    copy_file(source_file, target_path)
+                    operation = "copied"
+            else:
+                shutil.move(str(source_file), target_path)
+                operation = "moved"
+            
+            message = f"Successfully {operation} to {target_path.relative_to(self.output_base_path)}"
+            return True, target_path, message
+            
+        except Exception as e:
+            error_msg = f"Error organizing file {source_file}: {e}"
+            logger.error(error_msg)
+            return False, None, error_msg
+    
+    def _ensure_folder(self, folder: Path):
+        """Create folder unless it has already been created this run."""
+        if folder not in self._ensured_folders:
+            folder.mkdir(parents=True, exist_ok=True)
+            self._ensured_folders.add(folder)
+    
     def _sanitize_folder_name(self, folder_name: str) -> str:
         """Sanitize folder name for filesystem compatibility."""
-        # Replace problematic characters
-        problematic_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
-        for char in problematic_chars:
-            folder_name = folder_name.replace(char, '_')
-        
-        # Remove leading/trailing dots and spaces
-        folder_name = folder_name.strip('. ')
-        
-        # Limit length
-        folder_name = folder_name[:100]
+        # Replace problematic characters, remove leading/trailing dots and
+        # spaces, and limit length
+        folder_name = folder_name.translate(_FOLDER_TRANSLATION).strip('. ')[:100]
         
         # Ensure it's not empty
-        if not folder_name:
-            folder_name = "Uncategorized"
-        
-        return folder_name
+        return folder_name or "Uncategorized"
     
     def _sanitize_filename(self, filename: str) -> str:
         """Sanitize filename for filesystem compatibility."""
-        # Replace problematic characters
-        problematic_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
-        for char in problematic_chars:
-            filename = filename.replace(char, '_')
-        
-        # Replace spaces with underscores
-        filename = filename.replace(' ', '_')
+        # Replace problematic characters and spaces with underscores in one pass
+        filename = filename.translate(_FILENAME_TRANSLATION)
         
         # Remove multiple consecutive underscores
-        while '__' in filename:
-            filename = filename.replace('__', '_')
+        filename = _UNDERSCORE_RUN_RE.sub('_', filename)
         
         # Remove leading/trailing underscores and dots
         filename = filename.strip('_. ')
@@ -118,35 +222,71 @@ class FileRenamer:
         filename = filename[:80]
         
         # Ensure it's not empty
-        if not filename:
-            filename = "unnamed_file"
-        
-        return filename
+        return filename or "unnamed_file"
     
     def _handle_naming_collision(self, target_path: Path) -> Path:
         """Handle naming collisions by appending a suffix."""
-        if not target_path.exists():
-            return target_path
-        
-        base_name = target_path.stem
-        extension = target_path.suffix
         parent_dir = target_path.parent
+        with self._folder_lock(parent_dir):
+            listing = self._dir_listing(parent_dir)
+            final_name = self._find_free_name(target_path.stem, target_path.suffix, listing)
+            listing.add(final_name.casefold())
+            return parent_dir / final_name
+    
+    @staticmethod
+    def _folder_key(folder: Path) -> str:
+        """Key folders so that paths differing only in case share a listing and lock."""
+        return str(folder).casefold()
+    
+    def _folder_lock(self, folder: Path) -> threading.Lock:
+        """Return the lock guarding name reservations in folder."""
+        key = self._folder_key(folder)
+        with self._folder_locks_guard:
+            lock = self._folder_locks.get(key)
+            if lock is None:
+                lock = self._folder_locks[key] = threading.Lock()
+            return lock
+    
+    def _dir_listing(self, folder: Path) -> Set[str]:
+        """Return the cached set of casefolded names in folder (folder lock must be held)."""
+        listing = self._dir_listings.setdefault(self._folder_key(folder), set())
+        # On case-sensitive filesystems "Receipts" and "receipts" are distinct
+        # folders sharing one listing, so each spelling is scanned into it
+        if folder not in self._listed_folders:
+            try:
+                with os.scandir(folder) as entries:
+                    listing.update(entry.name.casefold() for entry in entries)
+            except FileNotFoundError:
+                pass
+            self._listed_folders.add(folder)
+        return listing
+    
+    def _find_free_name(self, base_name: str, extension: str, listing: Set[str]) -> str:
+        """Find an unused variant of base_name + extension, one past the highest existing suffix."""
+        name = f"{base_name}{extension}"
+        if name.casefold() not in listing:
+            return name
         
-        counter = 1
-        while True:
-            new_name = f"{base_name}_{counter:03d}{extension}"
-            new_path = parent_dir / new_name
-            if not new_path.exists():
-                return new_path
-            counter += 1
-            
-            # Safety check to avoid infinite loop
-            if counter > 999:
-                # Use timestamp as fallback
-                import time
-                timestamp = int(time.time())
-                new_name = f"{base_name}_{timestamp}{extension}"
-                return parent_dir / new_name
+        suffix_re = re.compile(rf'{re.escape(base_name.casefold())}_(\d{{3}}){re.escape(extension.casefold())}')
+        used = set()
+        for existing in listing:
+            match = suffix_re.fullmatch(existing)
+            if match:
+                used.add(int(match.group(1)))
+        
+        counter = max(used, default=0) + 1
+        if counter > 999:
+            # Past the last suffix: reuse the lowest free one instead
+            counter = next((n for n in range(1, 1000) if n not in used), None)
+        if counter is not None:
+            return f"{base_name}_{counter:03d}{extension}"
+        
+        # Safety check: fall back to a timestamp once the suffixes run out
+        import time
+        timestamp = int(time.time())
+        while f"{base_name}_{timestamp}{extension}".casefold() in listing:
+            timestamp += 1
+        return f"{base_name}_{timestamp}{extension}"
     
     def create_summary_report(self, processed_files: list) -> str:
         """Create a summary report of processed files."""
@@ -155,8 +295,8 @@ class FileRenamer:
         
         report_lines = ["File Organization Summary", "=" * 50, ""]
         
-        successful = [f for f in processed_files if f['success']]
-        failed = [f for f in processed_files if not f['success']]
+        successful = [f for f in processed_files if f.success]
+        failed = [f for f in processed_files if not f.success]
         
         report_lines.append(f"Total files processed: {len(processed_files)}")
         report_lines.append(f"Successfully organized: {len(successful)}")
@@ -166,21 +306,27 @@ class FileRenamer:
         if successful:
             report_lines.append("Successfully organized files:")
             report_lines.append("-" * 30)
-            for file_info in successful:
-                original = file_info['original_name']
-                new_path = file_info['new_path']
-                category = file_info['category']
-                relative_path = new_path.relative_to(self.output_base_path) if new_path else "Unknown"
-                report_lines.append(f"  {original} → {relative_path} [{category}]")
+            # Organized files all live under the output folder, so their
+            # relative paths are a fixed-length slice of the full path
+            base_str = str(self.output_base_path) + os.sep
+            report_lines.extend(
+                f"  {f.original_name} → {self._relative_path_str(f.new_path, base_str)} [{f.category}]"
+                for f in successful
+            )
             report_lines.append("")
         
         if failed:
             report_lines.append("Failed files:")
             report_lines.append("-" * 15)
-            for file_info in failed:
-                original = file_info['original_name']
-                error = file_info['error_message']
-                report_lines.append(f"  {original}: {error}")
+            report_lines.extend(f"  {f.original_name}: {f.error_message}" for f in failed)
             report_lines.append("")
         
-        return "\n".join(report_lines)
\ No newline at end of file
+        return "\n".join(report_lines)
+    
+    @staticmethod
+    def _relative_path_str(path: Optional[Path], base_str: str) -> str:
+        """Return path relative to the output folder, given the folder as a string with a trailing separator."""
+        if not path:
+            return "Unknown"
+        path_str = str(path)
+        return path_str[len(base_str):] if path_str.startswith(base_str) else path_str